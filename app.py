@@ -1,14 +1,18 @@
-from flask import Flask, render_template, request
-from module.openaq_api import *
-from module.prediction import *
-from module.visualizer import *
+from flask import Flask, Response, jsonify, render_template, request
+from module.openaq_api import get_country_by_name, get_daily_data_by_country, get_historic_data_by_country, get_ranking_by_country, get_multi_pollutant_data_by_country, get_stations_by_country
+from module.iaqi import POLLUTANT_LABELS
+from module.prediction import predict_7_days
+from module.profiling import init_profiling
+from module.visualizer import create_hourly_line_chart, create_prediction_column_chart, get_aqi_status_info
 from datetime import datetime
+import math
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
+init_profiling(app) # off unless PROFILE_SAMPLE_RATE / PROFILE_SECRET are set, see module/profiling.py
 
 @app.route('/')
 def index():
@@ -39,10 +43,30 @@ def dashboard():
         last_30_data = get_historic_data_by_country(country, country_id, days=30) # get last 30-day data for ML to have more differences and better rolling windows
         prediction_dates, prediction_values, prediction_aqi = predict_7_days(last_30_data, country_id)
 
+        # Get dominant pollutant (composite AQI over PM2.5, PM10, O3, NO2); the page still renders without it
+        dominant_pollutant = None
+        try:
+            pollutant_df = get_multi_pollutant_data_by_country(country, country_id)
+            if pollutant_df is not None:
+                latest = pollutant_df.iloc[-1]
+                dominant_pollutant = {
+                    'name': POLLUTANT_LABELS.get(latest['dominant'], latest['dominant']),
+                    'aqi': int(latest['aqi']),
+                    'info': get_aqi_status_info(int(latest['aqi']))
+                }
+        except Exception as e:
+            print(f"Multi-pollutant data unavailable: {e}")
+
         # Get top 10 stations
         ranking_df = get_ranking_by_country(country_id)
         top_10_stations = ranking_df.head(10).to_dict('records') if ranking_df is not None else []
 
+        # Cache station coordinates for /nearby; lookups just don't cover this country without them
+        try:
+            get_stations_by_country(country_id)
+        except Exception as e:
+            print(f"Station locations unavailable: {e}")
+
         # Create charts by selected metric
         hourly_line_chart = create_hourly_line_chart(hourly_df, metric)
         prediction_column_chart = create_prediction_column_chart(prediction_dates, prediction_values, prediction_aqi, metric)
@@ -52,11 +76,14 @@ def dashboard():
                                current_pm25=latest_pm25,
                                current_aqi=latest_aqi,
                                aqi_info=aqi_info['status'],
+                               aqi_status=aqi_info['status'],
                                aqi_color=aqi_info['color'],
                                historical_chart=hourly_line_chart,
                                prediction_chart=prediction_column_chart,
                                top_10_stations=top_10_stations,
+                               dominant_pollutant=dominant_pollutant,
                                selected_metric=metric,
+                               last_time=hourly_df.index[-1].isoformat(),
                                now=datetime.now(),
                                get_aqi_status_info=get_aqi_status_info)
     
@@ -66,5 +93,66 @@ def dashboard():
         traceback.print_exc() # print exception
         return render_template('index.html', error=f'Error processing data: {e}')
     
+@app.route('/stream/<country>')
+def stream(country):
+    # Server-Sent Events: pushes new hourly points, KPI and ranking changes to an open dashboard
+    from module.live import get_feed
+
+    feed = get_feed(country)
+    if isinstance(feed, str): # country not found
+        return Response(feed, status=404, mimetype='text/plain')
+
+    # Time of the last point the browser has: the id of the last event it received when reconnecting,
+    # else the time of the last point the page was rendered with
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    return Response(
+        feed.events(since),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # no proxy buffering (nginx)
+    )
+
+@app.route('/nearby')
+def nearby():
+    # Stations around a point (nearest k, or all within km) and an IDW estimate of the local AQI,
+    # answered from the spatial index over every country cached so far
+    from module.spatial import local_aqi, nearest_stations, stations_within
+
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        k = int(request.args.get('k', 5))
+        km = request.args.get('km', type=float)
+    except (KeyError, ValueError):
+        return jsonify(error='lat and lon are required numbers, k an integer and km a number'), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or k < 1 or (km is not None and km <= 0):
+        return jsonify(error='lat/lon out of range, or k/km not positive'), 400
+
+    found = stations_within(lat, lon, km) if km is not None else nearest_stations(lat, lon, k)
+
+    stations = []
+    for station in found.to_dict('records'):
+        result = {
+            'location_id': int(station['location_id']),
+            'name': str(station['name']),
+            'latitude': float(station['latitude']),
+            'longitude': float(station['longitude']),
+            'distance_km': round(float(station['distance_km']), 2)
+        }
+        if not math.isnan(station.get('value', math.nan)): # station has a cached reading
+            aqi_info = get_aqi_status_info(int(station['aqi']))
+            result.update({
+                'value': round(float(station['value']), 1),
+                'aqi': int(station['aqi']),
+                'status': aqi_info['status'],
+                'time': station['time_to'].isoformat()
+            })
+        stations.append(result)
+
+    estimate = local_aqi(lat, lon)
+    if estimate is not None:
+        estimate['status'] = get_aqi_status_info(estimate['aqi'])['status']
+
+    return jsonify(stations=stations, local_aqi=estimate)
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True, threaded=True) # development only; each open /stream connection holds a thread, deploy with gunicorn (gunicorn.conf.py)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import argparse
+import sys
+from module.backtest import backtest
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the 7-day forecaster on cached history.')
+    parser.add_argument('--country-id', type=int, default=57, help='country whose model and history to use (default: 57, Cambodia)')
+    parser.add_argument('--days', type=int, default=365, help='history cache to replay, data/cache_<country>_<days>d.json (default: 365)')
+    parser.add_argument('--column', default='value', help='hourly column to forecast, e.g. robust_mean (default: value)')
+    parser.add_argument('--window', type=int, default=31, help='daily points the model sees per origin (default: 31, like 30 days in the app)')
+    parser.add_argument('--horizon', type=int, default=7, help='days forecast per origin (default: 7)')
+    parser.add_argument('--step', type=int, default=1, help='days between origins (default: 1)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-o', '--output', help='write every (origin, horizon) forecast to this CSV')
+    args = parser.parse_args(argv)
+
+    report = backtest(f'{args.country_id}_{args.days}d', args.country_id, args.column, args.window, args.horizon, args.step, args.workers)
+
+    print(f"\n{report['origins']} origins in {report['elapsed_s']:.2f}s")
+    print("\nError per horizon day (μg/m³):")
+    print(report['metrics'].round(2).to_string())
+    print("\nForecast latency per origin: " + ', '.join(f"{name} {value * 1000:.1f} ms" for name, value in report['latency_s'].items()))
+
+    if args.output:
+        report['results'].to_csv(args.output, index=False)
+        print(f"\nSaved forecasts to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,136 @@
+# Import-time benchmark for the app entry points.
+# Runs `python -X importtime -c "import <module>"` in a fresh interpreter, reports the slowest
+# imports and appends the totals to benchmarks/import_time_history.jsonl so cold start can be tracked over time.
+# The history file is committed: its first record is the pre-lazy-import baseline (df06c28). Commit a new record
+# with changes that affect startup, and use --no-save for ad-hoc runs so the tree stays clean.
+#
+# Usage: python benchmarks/import_time.py [module ...] [--top N] [--runs N] [--no-save]
+
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_FILE = os.path.join(ROOT, 'benchmarks', 'import_time_history.jsonl')
+DEFAULT_MODULES = ['app', 'console_app', 'module.openaq_api', 'module.prediction', 'module.visualizer']
+
+def measure_import(module_name):
+    # -X importtime writes one line per import to stderr:
+    # "import time: self [us] | cumulative | imported package"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+        raise RuntimeError(f"Importing {module_name} failed: {last_line}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append({
+            'name': name.strip(),
+            'depth': (len(name) - len(name.lstrip())) // 2, # nested imports are indented by 2 spaces per level
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us)
+        })
+
+    # Interpreter startup (encodings, site, ...) is logged too; everything after `site` belongs to the target
+    site_index = max((i for i, item in enumerate(imports) if item['name'] == 'site' and item['depth'] == 0), default=-1)
+    imports = imports[site_index + 1:]
+
+    total_us = sum(item['cumulative_us'] for item in imports if item['depth'] == 0)
+    return total_us, imports
+
+def benchmark(module_name, runs=3):
+    # Keep the fastest run, the others mostly measure disk cache noise
+    best_total, best_imports = None, None
+    for _ in range(runs):
+        total_us, imports = measure_import(module_name)
+        if best_total is None or total_us < best_total:
+            best_total, best_imports = total_us, imports
+    return best_total, best_imports
+
+def print_report(module_name, total_us, imports, top=10):
+    print(f"\n{module_name}: {total_us / 1000:.1f} ms ({len(imports)} modules imported)")
+    top_level = {}
+    for item in imports:
+        package = item['name'].split('.')[0]
+        top_level[package] = top_level.get(package, 0) + item['self_us']
+    for package, self_us in sorted(top_level.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f"  {package:<30} {self_us / 1000:8.1f} ms")
+
+def save_history(results):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'results_ms': {name: round(total_us / 1000, 1) for name, total_us in results.items()}
+    }
+    with open(HISTORY_FILE, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    print(f"\nSaved to {HISTORY_FILE}")
+
+def print_previous(results):
+    if not os.path.exists(HISTORY_FILE):
+        return
+    with open(HISTORY_FILE) as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return
+    previous = json.loads(lines[-1])
+    print(f"\nCompared to {previous['timestamp']} ({previous.get('commit') or 'no commit'}):")
+    for name, total_us in results.items():
+        before = previous['results_ms'].get(name)
+        if before is not None:
+            print(f"  {name:<30} {before:8.1f} ms -> {total_us / 1000:8.1f} ms")
+
+def main(argv):
+    top = 10
+    runs = 3
+    save = True
+    modules = []
+
+    args = iter(argv)
+    for arg in args:
+        if arg == '--top':
+            top = int(next(args))
+        elif arg == '--runs':
+            runs = int(next(args))
+        elif arg == '--no-save':
+            save = False
+        else:
+            modules.append(arg)
+    modules = modules or DEFAULT_MODULES
+
+    results = {}
+    for module_name in modules:
+        try:
+            total_us, imports = benchmark(module_name, runs)
+        except RuntimeError as e:
+            print(e)
+            continue
+        results[module_name] = total_us
+        print_report(module_name, total_us, imports, top)
+
+    if not results:
+        return 1
+
+    print_previous(results)
+    if save:
+        save_history(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,25 @@
-from module.openaq_api import *
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from module.openaq_api import get_country_by_name, get_daily_data_by_country, get_historic_data_by_country, get_kpi, get_kpi_card, reset_cache_stats, get_cache_stats
+
+MAX_AGE = 3600 # batch runs refetch the 1-day series once its cache is older than this (seconds)
+HISTORY_MAX_AGE = 24 * 3600 # the 30-day history behind the forecast moves slowly, refetch daily
+STALE_AFTER = 3 * 3600 # OpenAQ readings lag about an hour; a latest reading older than this is reported as stale
+
+# Columns of the batch output (list values are joined with ';' in CSV mode)
+FIELDS = [
+    'country', 'country_id', 'status', 'error',
+    'kpi_pm25', 'kpi_aqi', 'kpi_status',
+    'latest_time', 'latest_pm25', 'latest_aqi', 'stale',
+    'forecast_dates', 'forecast_pm25', 'forecast_aqi', 'forecast_error',
+    'elapsed_s', 'cache_hits', 'cache_misses'
+]
 
 def main():
     print("\n╔═════════════════════════════════════╗")
@@ -7,8 +28,157 @@ def main():
 
     search_country = input("Enter your country name: ")
     country_id = get_country_by_name(search_country)
-    data = get_daily_data_by_country(country_id)
+    if isinstance(country_id, str): # country_id returns error
+        print(country_id)
+        return
+    data = get_daily_data_by_country(search_country, country_id)
     print(data)
     get_kpi_card(search_country, data)
 
-main()
\ No newline at end of file
+def load_fresh(getter, *args, max_age):
+    # Refetch once the cache is older than max_age; if OpenAQ can't be reached, report the cached data
+    # (the stale flag then tells the reader how old it is) rather than nothing
+    try:
+        return getter(*args, max_age=max_age)
+    except Exception as e:
+        print(f"Refetch failed for {args[0]}, using cached data: {e}")
+        return getter(*args)
+
+def process_country(country, forecast=True, max_age=MAX_AGE):
+    # Runs inside a pool thread: cache stats are thread-local, so reset them for this country
+    reset_cache_stats()
+    start = time.perf_counter()
+    record = {field: None for field in FIELDS}
+    record['country'] = country
+
+    try:
+        country_id = get_country_by_name(country)
+        if isinstance(country_id, str): # country_id returns error
+            raise Exception(country_id)
+        record['country_id'] = country_id
+
+        hourly_df = load_fresh(get_daily_data_by_country, country, country_id, max_age=max_age)
+
+        kpi = get_kpi(hourly_df)
+        record['kpi_pm25'] = round(kpi['value'], 2)
+        record['kpi_aqi'] = kpi['aqi']
+        record['kpi_status'] = kpi['status']
+
+        record['latest_time'] = hourly_df.index[-1].isoformat()
+        record['latest_pm25'] = round(float(hourly_df['value'].iloc[-1]), 2)
+        record['latest_aqi'] = int(hourly_df['aqi'].iloc[-1])
+        latest_age = time.time() - hourly_df.index[-1].timestamp()
+        record['stale'] = bool(latest_age > max(max_age, STALE_AFTER))
+
+        if forecast:
+            from module.prediction import predict_7_days # only load the models when a forecast is requested
+
+            last_30_data = load_fresh(get_historic_data_by_country, country, country_id, 30, max_age=max(max_age, HISTORY_MAX_AGE))
+            forecast_dates, forecast_aqi, forecast_pm25 = predict_7_days(last_30_data, country_id)
+            record['forecast_dates'] = forecast_dates
+            record['forecast_pm25'] = forecast_pm25
+            record['forecast_aqi'] = forecast_aqi
+            if not forecast_dates: # predict_7_days returns empty lists when the model is missing or fails
+                record['forecast_error'] = f'No forecast for country {country_id}: model missing or prediction failed'
+
+        if record['stale']:
+            record['status'] = 'stale'
+        elif record['forecast_error']:
+            record['status'] = 'partial'
+        else:
+            record['status'] = 'ok'
+
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+
+    stats = get_cache_stats()
+    record['cache_hits'] = stats['hits']
+    record['cache_misses'] = stats['misses']
+    record['elapsed_s'] = round(time.perf_counter() - start, 3)
+    return record
+
+def read_countries(countries, file_path=None):
+    names = list(countries)
+    if file_path:
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'): # one country per line, '#' for comments
+                    names.append(line)
+    return names
+
+class RecordWriter:
+    def __init__(self, out, output_format):
+        self.out = out
+        self.output_format = output_format
+        self.lock = threading.Lock() # records are written from the pool as soon as each country finishes
+        self.csv_writer = None
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(out, fieldnames=FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, record):
+        with self.lock:
+            if self.csv_writer:
+                row = {key: ';'.join(str(v) for v in value) if isinstance(value, list) else value for key, value in record.items()}
+                self.csv_writer.writerow(row)
+            else:
+                self.out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.out.flush()
+
+def print_summary(records, total_elapsed, out):
+    print("\n--- Batch summary ---", file=out)
+    for record in records:
+        lookups = record['cache_hits'] + record['cache_misses']
+        hit_rate = f"{record['cache_hits'] / lookups:.0%}" if lookups else '-'
+        print(f"{record['country']:<25} {record['status']:<7} {record['elapsed_s']:8.2f}s  cache {record['cache_hits']}/{lookups} ({hit_rate})", file=out)
+
+    ok_count = sum(1 for record in records if record['status'] == 'ok')
+    hits = sum(record['cache_hits'] for record in records)
+    lookups = hits + sum(record['cache_misses'] for record in records)
+    hit_rate = f"{hits / lookups:.0%}" if lookups else '-'
+    print(f"\n{ok_count}/{len(records)} countries ok in {total_elapsed:.2f}s, cache hit rate {hit_rate} ({hits}/{lookups})", file=out)
+
+def run_batch(countries, output_format='jsonl', workers=4, forecast=True, output_path=None, max_age=MAX_AGE):
+    out = open(output_path, 'w', newline='', encoding='utf-8') if output_path else sys.stdout
+    writer = RecordWriter(out, output_format)
+    records = []
+    start = time.perf_counter()
+
+    try:
+        # The data/prediction modules log with print(); send that to stderr so stdout only carries records
+        with contextlib.redirect_stdout(sys.stderr):
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = [executor.submit(process_country, country, forecast, max_age) for country in countries]
+                for future in as_completed(futures):
+                    record = future.result()
+                    writer.write(record)
+                    records.append(record)
+    finally:
+        if output_path:
+            out.close()
+
+    order = {country: i for i, country in enumerate(countries)}
+    records.sort(key=lambda record: order[record['country']])
+    print_summary(records, time.perf_counter() - start, sys.stderr)
+
+    return 0 if all(record['status'] == 'ok' for record in records) else 1
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Air quality monitor. Without countries it runs interactively.')
+    parser.add_argument('countries', nargs='*', help='country names to process in batch mode')
+    parser.add_argument('-f', '--file', help='file with one country name per line')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='output format (default: jsonl)')
+    parser.add_argument('-o', '--output', help='write records to this file instead of stdout')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='countries processed concurrently (default: 4)')
+    parser.add_argument('--no-forecast', action='store_true', help='skip the 7-day forecast')
+    parser.add_argument('--max-age', type=int, default=MAX_AGE, help=f'refetch cached data older than this many seconds; records whose latest reading is older than max(max-age, {STALE_AFTER}) are marked stale (default: {MAX_AGE})')
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    countries = read_countries(args.countries, args.file)
+    if countries:
+        sys.exit(run_batch(countries, args.format, args.workers, not args.no_forecast, args.output, args.max_age))
+    main()
@@ -0,0 +1,24 @@
+# Production server settings: gunicorn app:app (this file is picked up from the working directory)
+#
+# Every open dashboard keeps a /stream connection open, and each open connection holds one worker thread
+# for as long as it stays open (it mostly sleeps on its queue, see module/live.py). With gunicorn's default
+# sync workers a handful of open dashboards would take every worker, so use threaded workers sized for the
+# number of dashboards expected to be open at once: WEB_WORKERS * WEB_THREADS connections in total.
+#
+# Not gevent: the cache's per-key file lock (fcntl.flock) blocks the whole process, so two greenlets waiting
+# on the same key in one worker would deadlock it.
+
+import os
+
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_WORKERS', '2'))
+threads = int(os.getenv('WEB_THREADS', '500')) # idle streams cost a mostly-sleeping thread each
+worker_connections = threads # per worker
+
+# gthread workers keep heartbeating while their threads serve long-lived streams, so the timeout only has
+# to cover a stuck worker; 120 s also leaves room for a cold dashboard render that fetches from OpenAQ
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 75 # above the usual proxy idle timeout (nginx: 60 s) so the proxy closes first
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
@@ -0,0 +1,97 @@
+# Hourly aggregation of raw station readings into one national row per hour.
+#
+# Everything is computed from a single sort of the readings by (hour, value):
+#   value          mean of all readings (what the charts and the trained model have always used)
+#   median, p10, p90
+#   robust_mean    mean after dropping readings outside the Tukey fences (1.5 * IQR) of that hour,
+#                  so one broken sensor cannot drag the national value
+#   station_count  distinct stations reporting in that hour
+# Group sums/counts use np.add.reduceat / np.bincount instead of a groupby per statistic.
+
+IQR_FENCE = 1.5
+
+def floor_to_hour(times):
+    import pandas as pd
+
+    # Floor on the local wall clock (keeps +05:30 style offsets on their own hours), then move to UTC.
+    # Mixed offsets in one frame (a DST change inside a 30/365-day fetch) are parsed as UTC instead:
+    # pandas 3 raises for them, pandas 2.x warns and returns object dtype
+    import warnings
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            parsed = pd.to_datetime(times, format='ISO8601')
+        if not pd.api.types.is_datetime64_any_dtype(parsed):
+            raise ValueError('mixed UTC offsets')
+    except ValueError:
+        parsed = pd.to_datetime(times, utc=True, format='ISO8601')
+    parsed = pd.DatetimeIndex(parsed)
+    if parsed.tz is None:
+        parsed = parsed.tz_localize('UTC')
+    return parsed.floor('h').tz_convert('UTC')
+
+def group_quantile(sorted_values, starts, counts, q):
+    import numpy as np
+
+    # Linear interpolation between order statistics, like np.percentile, for every group at once
+    position = starts + q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+def aggregate_hourly(df, time_column='time_to', value_column='value', station_column='name'):
+    import numpy as np
+    import pandas as pd
+
+    values = pd.to_numeric(df[value_column], errors='coerce').to_numpy(dtype='float64')
+    hours = floor_to_hour(df[time_column])
+    valid = ~np.isnan(values)
+
+    hour_ns = hours.as_unit('ns').asi8[valid]
+    values = values[valid]
+
+    # 1. One sort by (hour, value): groups become contiguous and sorted inside, ready for quantiles
+    order = np.lexsort((values, hour_ns))
+    hour_ns = hour_ns[order]
+    values = values[order]
+
+    unique_hours, starts, counts = np.unique(hour_ns, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(unique_hours)), counts) # group number of every sorted reading
+
+    # 2. Mean and quantiles
+    sums = np.add.reduceat(values, starts) if len(values) else np.zeros(0)
+    mean = sums / np.maximum(counts, 1)
+
+    q1 = group_quantile(values, starts, counts, 0.25)
+    median = group_quantile(values, starts, counts, 0.5)
+    q3 = group_quantile(values, starts, counts, 0.75)
+    p10 = group_quantile(values, starts, counts, 0.1)
+    p90 = group_quantile(values, starts, counts, 0.9)
+
+    # 3. Outlier-filtered mean: keep readings inside that hour's fences
+    iqr = q3 - q1
+    inside = (values >= (q1 - IQR_FENCE * iqr)[group]) & (values <= (q3 + IQR_FENCE * iqr)[group])
+    kept_sums = np.bincount(group, weights=np.where(inside, values, 0.0), minlength=len(unique_hours))
+    kept_counts = np.bincount(group, weights=inside, minlength=len(unique_hours))
+    robust_mean = np.divide(kept_sums, kept_counts, out=mean.copy(), where=kept_counts > 0)
+
+    # 4. Distinct stations per hour
+    if station_column in df.columns:
+        station_codes = pd.factorize(df[station_column].to_numpy()[valid])[0][order] + 1 # missing names (-1) become 0
+        n_stations = int(station_codes.max()) + 1 if len(station_codes) else 1
+        pairs = np.unique(group * n_stations + station_codes)
+        station_count = np.bincount(pairs // n_stations, minlength=len(unique_hours))
+    else:
+        station_count = counts
+
+    return pd.DataFrame({
+        'time_to': pd.DatetimeIndex(unique_hours.astype('datetime64[ns]')).tz_localize('UTC'),
+        'value': mean,
+        'median': median,
+        'p10': p10,
+        'p90': p90,
+        'robust_mean': robust_mean,
+        'station_count': station_count
+    })
@@ -0,0 +1,126 @@
+# Rolling-origin backtest of the deployed forecaster (forecast_from_daily, recursive over 7 days).
+#
+# For every origin day in the history, the model sees only the `window` days up to the origin (the app
+# feeds it 30 days) and forecasts the next `horizon` days, which are compared with the observed daily means.
+# Origins are split across worker processes; the daily means of the hourly history are cached as their own
+# key, so repeated runs (e.g. comparing models) skip straight to forecasting. Gaps are interpolated per
+# window, as predict_7_days does on its 30 days, so no window sees values from after its origin.
+
+import time
+from module.cache import cache_age, read_cache, write_cache
+
+# Worker-process state, set once per process by init_worker
+_worker = {}
+
+def load_daily_history(key, column='value'):
+    # key is a cache key like '57_365d'; the daily means are stored as '<key>_daily_mean_<column>'.
+    # Days without data stay NaN here: they are only interpolated within each window
+    import pandas as pd
+    from module.schema import compact_series_frame
+
+    source_age = cache_age(key)
+    if source_age is None:
+        raise FileNotFoundError(f"No cached history for {key}")
+
+    daily_key = f'{key}_daily_mean_{column}'
+    daily_age = cache_age(daily_key)
+    if daily_age is not None and daily_age <= source_age: # resample is newer than the history it came from
+        daily = read_cache(daily_key)
+        if daily is not None:
+            daily.index = pd.DatetimeIndex(pd.to_datetime(daily.pop('time_to'), utc=True), name='time_to')
+            return daily
+
+    history = compact_series_frame(read_cache(key))
+    if column not in history.columns:
+        raise ValueError(f"Column {column} not in {key}")
+
+    daily = history[[column]].astype('float64').rename(columns={column: 'value'}).resample('D').mean()
+
+    write_cache(daily_key, daily.reset_index())
+    return daily
+
+def init_worker(daily, country_id):
+    from module.prediction import load_models
+
+    _worker['daily'] = daily
+    _worker['model'], _worker['scaler'] = load_models(country_id)
+
+def run_origins(origins, window, horizon):
+    # Returns one row per (origin, horizon day): forecast, persistence baseline, observed value, latency
+    from module.prediction import fill_gaps, forecast_from_daily
+
+    daily = _worker['daily']
+    model = _worker['model']
+    scaler = _worker['scaler']
+
+    rows = []
+    for origin in origins:
+        history = fill_gaps(daily.iloc[origin - window + 1:origin + 1][['value']]) # only data up to the origin
+
+        start = time.perf_counter()
+        forecast = forecast_from_daily(history, model, scaler, horizon)
+        latency = time.perf_counter() - start
+
+        last_value = history['value'].iloc[-1]
+        for day, (date, pred_value, _) in enumerate(forecast, 1):
+            rows.append({
+                'origin': daily.index[origin],
+                'horizon': day,
+                'forecast': pred_value,
+                'persistence': last_value, # "tomorrow looks like today", the bar the model has to beat
+                'observed': daily['value'].iloc[origin + day], # actual daily mean, NaN on days without data
+                'latency_s': latency
+            })
+    return rows
+
+def backtest(key, country_id, column='value', window=31, horizon=7, step=1, workers=None):
+    # window=31: 30 days of hourly data resample to ~31 daily points in the app
+    import os
+    import numpy as np
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+
+    from module.prediction import load_models
+
+    model, scaler = load_models(country_id) # fail here rather than in every worker
+    if model is None or scaler is None:
+        raise FileNotFoundError(f"Model or scaler for country {country_id} not found")
+
+    daily = load_daily_history(key, column)
+
+    origins = list(range(window - 1, len(daily) - horizon, step))
+    if not origins:
+        raise ValueError(f"History of {len(daily)} days is too short for window={window}, horizon={horizon}")
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [origins[i::workers] for i in range(workers) if origins[i::workers]]
+
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=len(chunks), initializer=init_worker, initargs=(daily, country_id)) as executor:
+        for chunk_rows in executor.map(run_origins, chunks, [window] * len(chunks), [horizon] * len(chunks)):
+            rows.extend(chunk_rows)
+    elapsed = time.perf_counter() - start
+
+    results = pd.DataFrame(rows).sort_values(['origin', 'horizon']).reset_index(drop=True)
+
+    scored = results.dropna(subset=['observed'])
+    error = scored['forecast'] - scored['observed']
+    baseline_error = scored['persistence'] - scored['observed']
+    metrics = pd.DataFrame({
+        'n': scored.groupby('horizon').size(),
+        'mae': error.abs().groupby(scored['horizon']).mean(),
+        'rmse': np.sqrt((error ** 2).groupby(scored['horizon']).mean()),
+        'persistence_mae': baseline_error.abs().groupby(scored['horizon']).mean()
+    })
+
+    latencies = results.drop_duplicates('origin')['latency_s'].to_numpy()
+    latency = {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 99)}
+
+    return {
+        'origins': len(origins),
+        'elapsed_s': elapsed,
+        'metrics': metrics,
+        'latency_s': latency,
+        'results': results
+    }
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl # POSIX
+except ImportError:
+    fcntl = None
+    import msvcrt # Windows
+
+# Cache files are only ever replaced as a whole (temp file + os.replace), so readers never see a
+# half-written file and never need a lock. Writers take an advisory lock per key so only one
+# process fetches and writes a given key at a time; the others wait and then reuse its result.
+
+CACHE_DIR = 'data'
+LOCK_DIR = os.path.join(CACHE_DIR, '.locks')
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, f'cache_{key}.json')
+
+def cache_age(key):
+    # Seconds since the key was last written, None if it was never written
+    try:
+        return time.time() - os.path.getmtime(cache_path(key))
+    except OSError:
+        return None
+
+def read_cache(key, max_age=None):
+    import pandas as pd
+
+    path = cache_path(key)
+    age = cache_age(key)
+    if age is None:
+        return None
+    if max_age is not None and age > max_age: # stale, treat as a miss
+        return None
+
+    print(f"Loading data from cache: {path}")
+    try:
+        return pd.read_json(path, orient='records') # orient='records':  the DataFrame is converted into a list of dictionaries, where each dictionary represents a row in the DataFrame.
+    except Exception as e:
+        print(f"Error loading cache: {e}")
+        return None
+
+def write_cache(key, df):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(key)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.cache_{key}.', suffix='.tmp', dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            df.to_json(f, orient='records', date_format='iso')
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def replace_file(src, dst, retries=5):
+    # os.replace is atomic on the same filesystem; on Windows it fails while a reader has dst open, so retry briefly
+    for attempt in range(retries):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+@contextmanager
+def cache_lock(key):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    lock_file = open(os.path.join(LOCK_DIR, f'cache_{key}.lock'), 'a+')
+    try:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) # blocks until the current writer is done
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError: # LK_LOCK gives up after ~10 seconds, keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        lock_file.close()
+
+def load_or_fetch(key, fetch, max_age=None):
+    # Returns (df, from_cache). fetch() is only called by the one process holding the key's lock.
+    # max_age (seconds) refetches files older than that; by default a cached key never expires
+    df = read_cache(key, max_age)
+    if df is not None:
+        return df, True
+
+    with cache_lock(key):
+        # Another worker may have written the key while we were waiting for the lock
+        df = read_cache(key, max_age)
+        if df is not None:
+            return df, True
+
+        df = fetch()
+        write_cache(key, df)
+        return df, False
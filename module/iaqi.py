@@ -0,0 +1,79 @@
+# Vectorized US EPA AQI.
+#
+# Same breakpoints, truncation and rounding as python-aqi's ALGO_EPA (what the app used per value so far),
+# but evaluated on whole numpy arrays: one searchsorted per pollutant instead of a Decimal computation per row.
+# Concentrations above the last breakpoint are capped at 500 instead of raising.
+
+AQI_BREAKPOINTS = [0, 51, 101, 151, 201, 301, 401]
+AQI_UPPER = [50, 100, 150, 200, 300, 400, 500]
+
+# pollutant: (EPA units, truncation precision, breakpoint low/high concentrations)
+BREAKPOINTS = {
+    'pm25': ('µg/m³', 0.1, [0.0, 12.1, 35.5, 55.5, 150.5, 250.5, 350.5], [12.0, 35.4, 55.4, 150.4, 250.4, 350.4, 500.4]),
+    'pm10': ('µg/m³', 1, [0, 55, 155, 255, 355, 425, 505], [54, 154, 254, 354, 424, 504, 604]),
+    'o3': ('ppm', 0.001, [0.000, 0.060, 0.076, 0.096, 0.116], [0.059, 0.075, 0.095, 0.115, 0.374]), # 8-hour average
+    'no2': ('ppb', 1, [0, 54, 101, 361, 650, 1250, 1650], [53, 100, 360, 649, 1249, 1649, 2049]), # 1-hour
+}
+
+POLLUTANT_LABELS = {'pm25': 'PM2.5', 'pm10': 'PM10', 'o3': 'O₃', 'no2': 'NO₂'}
+
+# µg/m³ -> ppb at 25°C and 1 atm: ppb = µg/m³ * 24.45 / molecular weight
+MOLECULAR_WEIGHTS = {'o3': 48.00, 'no2': 46.01}
+
+def to_epa_units(pollutant, values, units):
+    import numpy as np
+
+    # Convert sensor readings to the units the EPA breakpoints use
+    values = np.asarray(values, dtype='float64')
+    target = BREAKPOINTS[pollutant][0]
+    units = units.replace('ug', 'µg').replace('μg', 'µg').replace('m3', 'm³')
+    if units == target:
+        return values
+
+    if units == 'µg/m³' and pollutant in MOLECULAR_WEIGHTS:
+        ppb = values * 24.45 / MOLECULAR_WEIGHTS[pollutant]
+    elif units == 'ppm':
+        ppb = values * 1000
+    elif units == 'ppb':
+        ppb = values
+    else:
+        raise ValueError(f"Cannot convert {pollutant} from {units} to {target}")
+
+    return ppb / 1000 if target == 'ppm' else ppb
+
+def iaqi(pollutant, concentrations):
+    import numpy as np
+
+    _, precision, low, high = BREAKPOINTS[pollutant]
+    low = np.asarray(low, dtype='float64')
+    high = np.asarray(high, dtype='float64')
+
+    # Work in whole multiples of the pollutant's precision (truncated, like python-aqi's ROUND_DOWN), so the
+    # interpolation numerator is exact and .5 ties round half-even the same way Decimal does.
+    # The epsilon absorbs float noise like 12.1 / 0.1 -> 120.99999
+    c = np.asarray(concentrations, dtype='float64')
+    steps = np.floor(np.clip(c, 0, None) / precision + 1e-9)
+    low_steps = np.round(low / precision)
+    high_steps = np.round(high / precision)
+
+    idx = np.clip(np.searchsorted(low_steps, steps, side='right') - 1, 0, len(low) - 1)
+    aqi_low = np.asarray(AQI_BREAKPOINTS)[idx]
+    aqi_high = np.asarray(AQI_UPPER)[idx]
+
+    values = (aqi_high - aqi_low) * (steps - low_steps[idx]) / (high_steps[idx] - low_steps[idx]) + aqi_low
+    values = np.round(np.minimum(values, 500)) # np.round is half-even, like python-aqi
+    return np.where(np.isnan(c), np.nan, values)
+
+def composite_aqi(iaqis):
+    import numpy as np
+
+    # iaqis: dict pollutant -> IAQI array. Returns (AQI, dominant pollutant) arrays; NaN IAQIs are ignored
+    pollutants = list(iaqis)
+    stacked = np.vstack([np.asarray(iaqis[p], dtype='float64') for p in pollutants])
+    has_value = ~np.all(np.isnan(stacked), axis=0)
+
+    filled = np.where(np.isnan(stacked), -1, stacked)
+    dominant_idx = filled.argmax(axis=0)
+    aqi = np.where(has_value, filled.max(axis=0), np.nan)
+    dominant = np.where(has_value, np.array(pollutants, dtype=object)[dominant_idx], None)
+    return aqi, dominant
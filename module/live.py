@@ -0,0 +1,213 @@
+# Live dashboard updates over Server-Sent Events.
+#
+# One CountryFeed per country and process runs a refresh loop while at least one browser is subscribed.
+# Each refresh re-reads the hourly and ranking data (refetching once the cache is older than the refresh
+# interval; the per-key cache lock keeps that to one fetch across workers) and publishes only what changed:
+#   point    a new hourly reading
+#   kpi      the current PM2.5 / AQI card, when it changed
+#   ranking  the top 10 stations, when the list changed
+# Subscribers are just queues, so the OpenAQ and cache work stays at one refresh loop per country however
+# many dashboards are open. Each open /stream connection still holds one server thread while it is open:
+# size the server for that (gunicorn.conf.py: threaded workers), not for the default sync workers.
+
+import json
+import os
+import queue
+import threading
+from module.openaq_api import get_country_by_name, get_daily_data_by_country, get_ranking_by_country
+from module.visualizer import get_aqi_status_info
+
+REFRESH_SECONDS = int(os.getenv('LIVE_REFRESH_SECONDS', '300'))
+HEARTBEAT_SECONDS = 15 # keeps proxies from closing idle connections
+QUEUE_SIZE = 100 # a subscriber this far behind is dropped instead of buffering forever
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+def format_event(event, data, event_id=None):
+    # Points carry their time as the event id, so a reconnecting browser resumes via Last-Event-ID
+    # instead of replaying everything since the page was rendered
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+def format_point(point):
+    return format_event('point', point, point['time'])
+
+def point_payload(time_to, row):
+    point = {
+        'time': time_to.isoformat(),
+        'label': time_to.strftime('%H:%M<br>%b %d'), # same labels as create_hourly_line_chart
+        'value': round(float(row['value']), 2),
+        'aqi': int(row['aqi']),
+        'color': get_aqi_status_info(int(row['aqi']))['color']
+    }
+    if 'p10' in row and 'p90' in row:
+        point['p10'] = round(float(row['p10']), 2)
+        point['p90'] = round(float(row['p90']), 2)
+    return point
+
+def kpi_payload(hourly_df):
+    latest_aqi = int(hourly_df['aqi'].iloc[-1])
+    aqi_info = get_aqi_status_info(latest_aqi)
+    return {
+        'current_pm25': round(float(hourly_df['value'].iloc[-1])),
+        'current_aqi': latest_aqi,
+        'status': aqi_info['status'],
+        'color': aqi_info['color']
+    }
+
+def ranking_payload(ranking_df):
+    stations = []
+    for station in ranking_df.head(10).to_dict('records'):
+        aqi_info = get_aqi_status_info(int(station['aqi']))
+        stations.append({
+            'name': str(station['name']),
+            'value': round(float(station['value']), 1),
+            'aqi': int(station['aqi']),
+            'status': aqi_info['status'],
+            'color': aqi_info['color']
+        })
+    return stations
+
+class CountryFeed:
+    def __init__(self, country, country_id, interval=REFRESH_SECONDS):
+        self.country = country
+        self.country_id = country_id
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.subscribers = {} # queue -> 'since', time of the last point the subscriber had when it connected
+        self.thread = None
+        self.wakeup = threading.Event()
+
+        # Last published state, diffed against on every refresh
+        self.points = [] # point payloads, oldest first
+        self.kpi = None
+        self.ranking = None
+
+    def catch_up(self, subscriber, since):
+        # Send the points newer than the subscriber already has (the latest QUEUE_SIZE at most)
+        points = [point for point in self.points if since is None or point['time'] > since]
+        for point in points[-QUEUE_SIZE:]:
+            subscriber.put_nowait(format_point(point))
+
+    def subscribe(self, since=None):
+        subscriber = queue.Queue(maxsize=QUEUE_SIZE + 2)
+        with self.lock:
+            self.catch_up(subscriber, since)
+            if self.kpi is not None:
+                subscriber.put_nowait(format_event('kpi', self.kpi))
+            if self.ranking is not None:
+                subscriber.put_nowait(format_event('ranking', self.ranking))
+
+            self.subscribers[subscriber] = since
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name=f'live-feed-{self.country_id}', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.pop(subscriber, None)
+            if not self.subscribers:
+                self.wakeup.set() # let the refresh loop exit now instead of after the next interval
+
+    def send(self, message):
+        # Caller holds self.lock
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                print(f"Dropping slow live subscriber for {self.country}")
+                self.subscribers.pop(subscriber, None)
+                try:
+                    subscriber.get_nowait() # make room for the stop marker
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(None)
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self.lock:
+            self.send(message)
+
+    def refresh(self):
+        try:
+            hourly_df = get_daily_data_by_country(self.country, self.country_id, max_age=self.interval)
+            ranking_df = get_ranking_by_country(self.country_id, max_age=self.interval)
+        except Exception as e:
+            # OpenAQ unreachable: keep serving whatever is cached and try again next interval
+            print(f"Live refetch failed for {self.country}, using cached data: {e}")
+            hourly_df = get_daily_data_by_country(self.country, self.country_id)
+            ranking_df = get_ranking_by_country(self.country_id)
+
+        # Only this thread writes self.points, but subscribe() reads it: build the new list here and swap it in
+        # under the lock, together with sending the new points, so a subscriber sees each point exactly once
+        last_time = self.points[-1]['time'] if self.points else None
+        new_points = [point for point in (point_payload(time_to, row) for time_to, row in hourly_df.iterrows())
+                      if last_time is None or point['time'] > last_time]
+
+        with self.lock:
+            self.points = (self.points + new_points)[-len(hourly_df):]
+            if last_time is None: # first refresh: nothing was published yet, catch up whoever is already waiting
+                for subscriber, since in list(self.subscribers.items()):
+                    self.catch_up(subscriber, since)
+            else:
+                for point in new_points:
+                    self.send(format_point(point))
+
+        kpi = kpi_payload(hourly_df)
+        if kpi != self.kpi:
+            self.kpi = kpi
+            self.publish('kpi', kpi)
+
+        ranking = ranking_payload(ranking_df) if ranking_df is not None else []
+        if ranking != self.ranking:
+            self.ranking = ranking
+            self.publish('ranking', ranking)
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Live refresh failed for {self.country}: {e}")
+
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def events(self, since=None):
+        # Generator for the Flask response: one SSE message per published change, heartbeats in between
+        subscriber = self.subscribe(since)
+        try:
+            yield f"retry: {HEARTBEAT_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if message is None: # dropped by publish()
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+def get_feed(country):
+    # Returns the shared feed for a country, or an error string like get_country_by_name
+    key = country.lower().strip()
+    with _feeds_lock:
+        feed = _feeds.get(key)
+    if feed is not None:
+        return feed
+
+    country_id = get_country_by_name(country)
+    if isinstance(country_id, str): # country_id returns error
+        return country_id
+
+    with _feeds_lock:
+        return _feeds.setdefault(key, CountryFeed(country, country_id))
@@ -1,47 +1,91 @@
-from openaq import OpenAQ
 from datetime import datetime, timedelta
-import aqi
-import pandas as pd
 import os
-import json
+import threading
 from dotenv import load_dotenv
+from module.aggregation import aggregate_hourly
+from module.cache import load_or_fetch
+from module.iaqi import iaqi, composite_aqi, to_epa_units
+from module.schema import compact_series_frame, compact_ranking_frame, compact_pollutant_frame, compact_station_frame, memory_report
+
+# pandas, aqi and the OpenAQ SDK are imported inside the functions that need them,
+# so importing this module (app workers, console app) stays cheap until data is actually fetched
 
 load_dotenv()
 
-API_KEY = os.getenv('OPENAQ_API_KEY')
-client = OpenAQ(api_key=API_KEY)
+POLLUTANTS = ('pm25', 'pm10', 'o3', 'no2') # OpenAQ parameter names used by the multi-pollutant fetch
+MULTI_POLLUTANT_MAX_AGE = 3600 # the composite AQI is refetched hourly
+MULTI_POLLUTANT_LOOKBACK = '3h' # a pollutant's last IAQI still counts towards the composite this long after it
+MULTI_POLLUTANT_RETRY_AGE = 15 * 60 # an empty result (no other sensors, or the fetch failed) is cached too, but retried sooner
+
+_client = None
+_client_lock = threading.Lock()
+
+_countries = None # country name (lowercase) -> id, fetched once per process
+_countries_lock = threading.Lock()
+
+# Cache hits/misses are counted per thread, so a batch worker can report the rate for the country it is processing
+_cache_stats = threading.local()
+
+def get_client():
+    # Build the OpenAQ client on first use instead of at import time
+    global _client
+    if _client is None:
+        with _client_lock: # batch mode calls this from several threads
+            if _client is None:
+                from openaq import OpenAQ
+                _client = OpenAQ(api_key=os.getenv('OPENAQ_API_KEY'))
+    return _client
+
+def reset_cache_stats():
+    _cache_stats.hits = 0
+    _cache_stats.misses = 0
 
-CACHE_DIR = 'data'
+def get_cache_stats():
+    return {'hits': getattr(_cache_stats, 'hits', 0), 'misses': getattr(_cache_stats, 'misses', 0)}
+
+def record_cache(hit):
+    if hit:
+        _cache_stats.hits = getattr(_cache_stats, 'hits', 0) + 1
+    else:
+        _cache_stats.misses = getattr(_cache_stats, 'misses', 0) + 1
+
+def get_countries():
+    # The country list is the same for every lookup: fetch it once, not per dashboard or batch item.
+    # Concurrent first callers wait on the lock for the one fetch; a failed fetch is retried on the next call
+    global _countries
+    if _countries is None:
+        with _countries_lock:
+            if _countries is None:
+                countries = get_client().countries.list(
+                    limit=200
+                )
+                _countries = {country.name.lower(): country.id for country in countries.results}
+    return _countries
 
 def get_country_by_name(selected_country):
     try:
-        countries = client.countries.list(
-            limit=200
-        )
-        for country in countries.results:
-            if selected_country.lower().strip() == country.name.lower():
-                return country.id
+        country_id = get_countries().get(selected_country.lower().strip())
+        if country_id is not None:
+            return country_id
         return f'Cannot find results for {selected_country}'
     except Exception as e: 
         return f"Error finding countris: {e}"
     
-def get_daily_data_by_country(selected_country, country_id, days=1): # for one day only, just like the one we get from IQAIR
-    cache_file = os.path.join(CACHE_DIR, f'cache_{country_id}_{days}d.json')
-    
-    # 1. Check Cache
-    if os.path.exists(cache_file):
-        print(f"Loading data from cache: {cache_file}")
-        try:
-            df = pd.read_json(cache_file, orient='records') # orient='records':  the DataFrame is converted into a list of dictionaries, where each dictionary represents a row in the DataFrame.
-            return df
-        
-        except Exception as e:
-            print(f"Error loading cache: {e}")
+def get_daily_data_by_country(selected_country, country_id, days=1, max_age=None): # for one day only, just like the one we get from IQAIR
+    df, from_cache = load_or_fetch(f'{country_id}_{days}d', lambda: fetch_daily_data_by_country(selected_country, country_id, days), max_age)
+    record_cache(hit=from_cache)
+    df = compact_series_frame(df, selected_country)
+    memory_report(df, f'{country_id}_{days}d')
+    return df
+
+def fetch_daily_data_by_country(selected_country, country_id, days=1):
+    import pandas as pd
 
     print(f"Fetching data for {selected_country} (Last {days} days)...")
 
-    # 2. Fetch Data
+    # 1. Fetch Data
         # Get top locations (limit to 10 and then mean/median of them)
+    client = get_client()
     locations = client.locations.list(
         countries_id=country_id,
         parameters_id=2, # 2: PM2.5
@@ -98,48 +142,30 @@ def get_daily_data_by_country(selected_country, country_id, days=1): # for one d
 
     # return available_results # returns a list of dictionaries of each hour of each of the 10 locations
 
-    # 3. Aggregate
+    # 2. Aggregate: one row per hour with mean, median, p10/p90, robust mean and station count
     df = pd.DataFrame(available_results)
-
-    # Ensure datetime conversion with UTC to handle timezone aware strings
-    df['time_to'] = pd.to_datetime(df['time_to'])
-
-    # Resample to hourly average across all stations
-    # First, round time to nearest hour
-    df['time_to'] = df['time_to'].dt.floor('h')
-
-    # Group by time and take mean
-    df_agg = df.groupby('time_to')['value'].mean().reset_index()
-    df_agg.sort_values('time_to')
+    df_agg = aggregate_hourly(df)
 
     # Convert PM2.5 values to AQI
-    df_agg['aqi'] = df_agg['value'].apply(lambda x: aqi.to_aqi([(aqi.POLLUTANT_PM25, x)], algo=aqi.ALGO_EPA))
-    df_agg['time_to'] = pd.to_datetime(df['time_to'])
-    
-    # 4. Save to Cache
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
+    df_agg['aqi'] = iaqi('pm25', df_agg['value'])
 
-    df_agg.to_json(cache_file, orient='records', date_format='iso')
+    return df_agg # returns: sth like 23 2025-12-01 08:00:00+00:00  15.024756  14.8  ...
 
-    return df_agg # returns: sth like 23 2025-12-01 15:00:00+07:00  15.024756
+def get_historic_data_by_country(selected_country, country_id, days=30, max_age=None): 
+    df, from_cache = load_or_fetch(f'{country_id}_{days}d', lambda: fetch_historic_data_by_country(selected_country, country_id, days), max_age)
+    record_cache(hit=from_cache)
+    df = compact_series_frame(df, selected_country)
+    memory_report(df, f'{country_id}_{days}d')
+    return df
 
-def get_historic_data_by_country(selected_country, country_id, days=30): 
-    cache_file = os.path.join(CACHE_DIR, f'cache_{country_id}_{days}d.json')
-    
-    # 1. Check Cache
-    if os.path.exists(cache_file):
-        print(f"Loading data from cache: {cache_file}")
-        try:
-            df = pd.read_json(cache_file, orient='records') # orient='records':  the DataFrame is converted into a list of dictionaries, where each dictionary represents a row in the DataFrame.
-            return df
-        except Exception as e:
-            print(f"Error loading cache: {e}")
+def fetch_historic_data_by_country(selected_country, country_id, days=30):
+    import pandas as pd
 
     print(f"Fetching data for {selected_country} (Last {days} days)...")
 
-    # 2. If no cache, fetch Data
+    # 1. Fetch Data (with pagination)
         # Get top locations (limit to 10 and then mean/median of them)
+    client = get_client()
     locations = client.locations.list(
         countries_id=country_id,
         parameters_id=2, # 2: PM2.5
@@ -183,7 +209,7 @@ def get_historic_data_by_country(selected_country, country_id, days=30):
                         # print(f"Got {location.name} measurements!")
                         for m in measurements.results:
                             available_results.append({
-                                # 'name': location.name,
+                                'name': location.name, # used for the per-hour station count
                                 'time_to': m.period.datetime_to.local,
                                 'value': m.value
                             })
@@ -207,111 +233,251 @@ def get_historic_data_by_country(selected_country, country_id, days=30):
     
     # return available_results # returns a list of dictionaries of each hour of each of the 10 locations
 
-    # 3. Aggregate
+    # 2. Aggregate: one row per hour with mean, median, p10/p90, robust mean and station count
     df = pd.DataFrame(available_results)
+    df_agg = aggregate_hourly(df)
 
-    # Ensure datetime conversion with UTC to handle timezone aware strings
-    df['time_to'] = pd.to_datetime(df['time_to'])
-
-    # Resample to hourly average across all stations
-    # First, round time to nearest hour
-    df['time_to'] = df['time_to'].dt.floor('h')
+    # Convert PM2.5 values to AQI
+    df_agg['aqi'] = iaqi('pm25', df_agg['value'])
 
-    # Group by time and take mean
-    df_agg = df.groupby('time_to')['value'].mean().reset_index()
-    df_agg.sort_values('time_to')
+    return df_agg # returns: sth like 23 2025-12-01 08:00:00+00:00  15.024756  14.8  ...
 
-    # Convert PM2.5 values to AQI
-    df_agg['aqi'] = df_agg['value'].apply(lambda x: aqi.to_aqi([(aqi.POLLUTANT_PM25, x)], algo=aqi.ALGO_EPA))
-        
-    # 4. Save to Cache
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
+def get_ranking_by_country(country_id, max_age=None):
+    df, from_cache = load_or_fetch(f'{country_id}_ranking', lambda: fetch_ranking_by_country(country_id), max_age)
+    record_cache(hit=from_cache)
+    df = compact_ranking_frame(df)
+    memory_report(df, f'{country_id}_ranking')
+    return df
 
-    df_agg.to_json(cache_file, orient='records', date_format='iso')
+def fetch_ranking_by_country(country_id):
+    import pandas as pd
 
-    return df_agg # returns: sth like 23 2025-12-01 15:00:00+07:00  15.024756
+    client = get_client()
+    locations = client.locations.list(
+        countries_id=country_id,
+        parameters_id=2,
+        limit=60
+    )
 
-def get_ranking_by_country(country_id):
-    cache_file = os.path.join(CACHE_DIR, f'cache_{country_id}_ranking.json')
+    date_from = datetime.now() - timedelta(hours=1)
     
-    if os.path.exists(cache_file):
-        print(f"Loading data from cache: {cache_file}")
+    available_results = []
+
+    location_count = 0
+    for location in locations.results:
+        if location_count >= 10:
+            break
+
+        sensor_id = None
+        for sensor in location.sensors:
+            if sensor.parameter.id == 2: # id 2 in PM2.5 (we only take PM2.5)
+                sensor_id = sensor.id
+                break
+
+        measurements = client.measurements.list(
+            sensors_id=sensor_id,
+            datetime_from=date_from
+        )
+
+        if measurements.results:
+            latest = measurements.results[-1]
+            available_results.append({
+                'location_id': location.id,
+                'name': location.name,
+                'latitude': location.coordinates.latitude if location.coordinates else None,
+                'longitude': location.coordinates.longitude if location.coordinates else None,
+                'value': latest.value,
+                # 'units': latest.parameter.units, # Will no need unit when we work on AQI!!!
+                'time_to': latest.period.datetime_to.utc # kept tz-aware; the schema layer parses it
+            })
+            location_count += 1
+
+    available_results.sort(key=lambda x: x['value'], reverse=True)
+
+    # print("\n--- Air Quality Ranking (Highest PM2.5) ---")
+    # for index, result in enumerate(available_results, 1):
+    #     print(f"{index}. {result['name']}: {result['value']:.2f} {result['units']} at {result['time']}")
+
+    df = pd.DataFrame([
+        {
+            'time_to': result['time_to'],
+            'location_id': result['location_id'],
+            'name': result['name'],
+            'latitude': result['latitude'],
+            'longitude': result['longitude'],
+            'value': result['value'],
+        }
+        for result in available_results
+    ])
+    df['aqi'] = iaqi('pm25', df['value'])
+
+    return df
+
+def get_stations_by_country(country_id, max_age=24 * 3600): # station coordinates barely change, refresh daily
+    df, from_cache = load_or_fetch(f'{country_id}_stations', lambda: fetch_stations_by_country(country_id), max_age)
+    record_cache(hit=from_cache)
+    df = compact_station_frame(df)
+    memory_report(df, f'{country_id}_stations')
+    return df
+
+def fetch_stations_by_country(country_id):
+    import pandas as pd
+
+    # One locations call (max page size) for every PM2.5 station of the country, coordinates only
+    client = get_client()
+    locations = client.locations.list(
+        countries_id=country_id,
+        parameters_id=2,
+        limit=1000
+    )
+
+    available_results = []
+    for location in locations.results:
+        if location.coordinates is None:
+            continue
+        available_results.append({
+            'location_id': location.id,
+            'name': location.name,
+            'country_id': country_id,
+            'latitude': location.coordinates.latitude,
+            'longitude': location.coordinates.longitude
+        })
+
+    print(f"Found {len(available_results)} stations with coordinates in country {country_id}")
+    return pd.DataFrame(available_results, columns=['location_id', 'name', 'country_id', 'latitude', 'longitude'])
+
+def carry_forward(series, lookback):
+    # Forward-fill a time-indexed series, but only up to `lookback` after each real value
+    import pandas as pd
+
+    times = series.index.to_series()
+    last_seen = times.where(series.notna()).ffill()
+    return series.ffill().where(times - last_seen <= pd.Timedelta(lookback))
+
+def get_multi_pollutant_data_by_country(selected_country, country_id, days=1, pollutants=POLLUTANTS, max_age=MULTI_POLLUTANT_MAX_AGE):
+    # Returns None when the country has no data for these pollutants or the fetch failed
+    import pandas as pd
+
+    key = f'{country_id}_{days}d_' + '_'.join(pollutants)
+
+    def fetch():
+        # A failure is cached as an empty frame, so every dashboard render doesn't redo the whole crawl
         try:
-            df = pd.read_json(cache_file, orient='records') # orient='records':  the DataFrame is converted into a list of dictionaries, where each dictionary represents a row in the DataFrame.
-            return df
+            return fetch_multi_pollutant_data_by_country(selected_country, country_id, days, pollutants)
         except Exception as e:
-            print(f"Error loading cache: {e}")
+            print(f"Multi-pollutant fetch failed for {selected_country}: {e}")
+            return pd.DataFrame()
 
-    else:
-        locations = client.locations.list(
-            countries_id=country_id,
-            parameters_id=2,
-            limit=60
-        )
+    df, from_cache = load_or_fetch(key, fetch, max_age)
+    if df.empty and from_cache: # cached empty result: only kept for the shorter retry age
+        retry_age = MULTI_POLLUTANT_RETRY_AGE if max_age is None else min(max_age, MULTI_POLLUTANT_RETRY_AGE)
+        df, from_cache = load_or_fetch(key, fetch, retry_age)
+    record_cache(hit=from_cache)
+    if df.empty:
+        return None
 
-        date_from = datetime.now() - timedelta(hours=1)
-        
-        available_results = []
+    df = compact_pollutant_frame(df, selected_country)
+    memory_report(df, key)
+    return df
 
-        location_count = 0
-        for location in locations.results:
-            if location_count >= 10:
-                break
+def fetch_multi_pollutant_data_by_country(selected_country, country_id, days=1, pollutants=POLLUTANTS, max_workers=8):
+    import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
 
-            sensor_id = None
-            for sensor in location.sensors:
-                if sensor.parameter.id == 2: # id 2 in PM2.5 (we only take PM2.5)
-                    sensor_id = sensor.id
-                    break
+    print(f"Fetching {', '.join(pollutants)} for {selected_country} (Last {days} days)...")
 
-            measurements = client.measurements.list(
-                sensors_id=sensor_id,
-                datetime_from=date_from
-            )
+    # 1. One locations scan for all pollutants (no parameters_id filter), keeping every wanted sensor per location
+    client = get_client()
+    locations = client.locations.list(
+        countries_id=country_id,
+        limit=40
+    )
 
-            if measurements.results:
-                latest = measurements.results[-1]
-                # formatted_time_from = pd.to_datetime(latest.period.datetime_from.local).strftime("%Y-%m-%d %H:%M")
-                formatted_time_to = pd.to_datetime(latest.period.datetime_to.local).strftime("%Y-%m-%d %H:%M")
-
-                available_results.append({
-                    'name': location.name,
-                    'value': latest.value,
-                    # 'units': latest.parameter.units, # Will no need unit when we work on AQI!!!
-                    # 'time_from': formatted_time_from,
-                    'time_to': formatted_time_to
-                })
-                location_count += 1
+    datefrom = datetime.now() - timedelta(days=days)
+
+    sensor_jobs = [] # (location name, pollutant, units, sensor id)
+    location_count = 0
+    for location in locations.results:
+        if location_count >= 10:  # Stop after 10 locations, same budget as the PM2.5-only fetch
+            break
 
-        available_results.sort(key=lambda x: x['value'], reverse=True)
+        found = {}
+        for sensor in location.sensors:
+            if sensor.parameter.name in pollutants and sensor.parameter.name not in found:
+                found[sensor.parameter.name] = sensor
+        if found:
+            sensor_jobs.extend((location.name, pollutant, sensor.parameter.units, sensor.id) for pollutant, sensor in found.items())
+            location_count += 1
 
-        # print("\n--- Air Quality Ranking (Highest PM2.5) ---")
-        # for index, result in enumerate(available_results, 1):
-        #     print(f"{index}. {result['name']}: {result['value']:.2f} {result['units']} at {result['time']}")
+    print(f"Found {len(sensor_jobs)} sensors at {location_count} stations in {selected_country}")
 
-        df = pd.DataFrame([
+    # 2. Pull all sensors concurrently
+    def fetch_sensor(job):
+        name, pollutant, units, sensor_id = job
+        try:
+            measurements = client.measurements.list(
+                sensors_id=sensor_id,
+                datetime_from=datefrom,
+                limit=1000
+            )
+        except Exception as e:
+            print(f"Error fetching {pollutant} for location {name}: {e}")
+            return []
+        return [
             {
-                'time_to': result['time_to'],
-                'name': result['name'],
-                'value': result['value'],
+                'name': name,
+                'pollutant': pollutant,
+                'units': units,
+                'time_to': m.period.datetime_to.local,
+                'value': m.value
             }
-            for result in available_results
-        ])
-        df['aqi'] = df['value'].apply(lambda x: aqi.to_aqi([(aqi.POLLUTANT_PM25, x)], algo=aqi.ALGO_EPA))
+            for m in measurements.results
+        ]
 
-        if not os.path.exists(CACHE_DIR):
-            os.makedirs(CACHE_DIR)
+    available_results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for rows in executor.map(fetch_sensor, sensor_jobs):
+            available_results.extend(rows)
 
-        df.to_json(cache_file, orient='records', date_format='iso')
+    if not available_results:
+        raise Exception("No data found for this country.")
 
-        return df
+    # 3. Aggregate each pollutant per hour (in EPA units), then IAQIs and the composite AQI
+    df = pd.DataFrame(available_results)
+
+    hourly = {}
+    for pollutant, readings in df.groupby('pollutant'):
+        readings = readings.copy()
+        for units, index in readings.groupby('units').groups.items():
+            try:
+                readings.loc[index, 'value'] = to_epa_units(pollutant, readings.loc[index, 'value'], units)
+            except ValueError as e:
+                print(e)
+                readings = readings.drop(index)
+        if not readings.empty:
+            hourly[pollutant] = aggregate_hourly(readings).set_index('time_to')['value']
+
+    df_agg = pd.DataFrame(hourly).sort_index()
+    df_agg.index.name = 'time_to'
+
+    iaqis = {}
+    for pollutant in df_agg.columns:
+        concentrations = df_agg[pollutant]
+        if pollutant == 'o3': # EPA's O3 breakpoints are for 8-hour averages
+            concentrations = concentrations.rolling('8h', min_periods=1).mean()
+        df_agg[f'iaqi_{pollutant}'] = iaqi(pollutant, concentrations)
+        # Sensors report with different delays, so the newest hours often lack the slower pollutants:
+        # the composite uses each pollutant's latest IAQI from the last few hours, not only that hour's
+        iaqis[pollutant] = carry_forward(df_agg[f'iaqi_{pollutant}'], MULTI_POLLUTANT_LOOKBACK)
+
+    df_agg['aqi'], df_agg['dominant'] = composite_aqi(iaqis)
+
+    return df_agg.reset_index() # returns: time_to, pm25, pm10, ..., iaqi_pm25, iaqi_pm10, ..., aqi, dominant
+
+def get_kpi(df):
+    average_value = float(df['value'].mean())
+    pm25_aqi = int(iaqi('pm25', [average_value])[0])
 
-def get_kpi_card(selected_country, df):
-    average_value = df['value'].mean().mean()
-    # first .mean() computes mean of each row in column ['value'], second .mean() computes mean of each value of the only column of df['value'].mean()
-    pm25_aqi = aqi.to_aqi([(aqi.POLLUTANT_PM25, average_value)], algo=aqi.ALGO_EPA)
-    
     if pm25_aqi < 51:
         status = 'Good'
     elif pm25_aqi < 101:
@@ -324,6 +490,14 @@ def get_kpi_card(selected_country, df):
         status = 'Very Unhealthy'
     else:
         status = 'Hazardous'
+
+    return {'value': average_value, 'aqi': pm25_aqi, 'status': status}
+
+def get_kpi_card(selected_country, df):
+    kpi = get_kpi(df)
+    average_value = kpi['value']
+    pm25_aqi = kpi['aqi']
+    status = kpi['status']
     
     print(f"{selected_country.capitalize()} Air Quality Index")
     # print(f"Last updated at {df['time_to'].max().time()}, {df['time_to'].max().date()} Local Time")
@@ -1,11 +1,12 @@
-import pandas as pd
-import numpy as np
-import aqi
-import joblib
 import os
 from datetime import timedelta
 
+# pandas/numpy and joblib (which unpickles sklearn + xgboost) are imported lazily,
+# so only requests that actually forecast pay for them
+
 def load_models(country_id):
+    import joblib
+
     model_path = f'models/aqi_model_{country_id}.pkl'
     scaler_path = f'models/aqi_scaler_{country_id}.pkl'
 
@@ -35,6 +36,9 @@ def load_models(country_id):
     return model, scaler
 
 def create_features(diff_history, next_date):
+    import numpy as np
+    import pandas as pd
+
     features = {}
     
     def get_lag(data, n): # get nth lag from end of data
@@ -61,8 +65,71 @@ def create_features(diff_history, next_date):
     
     return features
 
-def predict_7_days(df, country_id):
+FEATURE_ORDER = [ # feature order must match training
+    'lag_1', 'lag_2', 'lag_3', 'lag_4', 'lag_5', 'lag_6', 'lag_7',
+    'lag_14', 'lag_30',
+    'rolling_mean_7', 'rolling_std_7',
+    'day_of_week_sin', 'day_of_week_cos', 'day_of_year_sin', 'day_of_year_cos'
+]
+
+def to_daily(df, column='value'):
+    import pandas as pd
+
+    # Frames from openaq_api are already indexed by time_to; older callers pass it as a column.
+    # Either way, work on our own copy instead of mutating the caller's frame
+    if 'time_to' in df.columns:
+        df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df['time_to'], utc=True), name='time_to'))
+
+    # Resameple to daily (float64 from here on, the diffs are small)
+    df_daily = df[[column]].astype('float64').rename(columns={column: 'value'}).resample('D').mean()
+    return fill_gaps(df_daily)
+
+def fill_gaps(df_daily):
+    # Days without data are interpolated from the days around them, within the frame given only
+    df_daily = df_daily.copy()
+    df_daily['value'] = df_daily['value'].interpolate(method='linear')
+    return df_daily
+
+def forecast_from_daily(df_daily, model, scaler, days=7):
+    # Recursive forecast: each predicted difference becomes a lag for the next day.
+    # Returns a list of (date, predicted value, predicted difference)
+    import pandas as pd
+
+    # Calculate differences using .diff()
+    history_diff = df_daily['value'].diff().dropna().tolist()
+    last_value = df_daily['value'].iloc[-1]
+    current_date = df_daily.index[-1]
+
+    forecast = []
+    for i in range(1, days + 1):
+        next_date = current_date + timedelta(days=i)
+
+        # Create features
+        features = create_features(history_diff, next_date)
+        X_next = pd.DataFrame([features], columns=FEATURE_ORDER)
+
+        # Scale features
+        X_next_scaled = scaler.transform(X_next)
+
+        # Predict difference
+        pred_diff = float(model.predict(X_next_scaled)[0])
+
+        pred_value = max(0, last_value + pred_diff)
+        forecast.append((next_date, pred_value, pred_diff))
+
+        # Append for next iteration
+        history_diff.append(pred_diff)
+        last_value = pred_value
+
+    return forecast
+
+def predict_7_days(df, country_id, column='value'): # column='robust_mean' forecasts from the outlier-filtered hourly mean
+    from module.iaqi import iaqi
+
     print(f"Starting prediction...")
+    if column not in df.columns:
+        print(f"Column {column} not in data, using value")
+        column = 'value'
     model, scaler = load_models(country_id)
 
     if model is None or scaler is None:
@@ -70,75 +137,26 @@ def predict_7_days(df, country_id):
         return [], [], []
     
     try:
-        # Change time_to as index
-        df['time_to'] = pd.to_datetime(df['time_to'])
-        df = df.set_index('time_to')
-
         print(f"DataFrame shape: {df.shape}")
-        print(f"Index type: {type(df.index)}")
 
-        # Resameple to daily
-        df_daily = df.resample('D').mean()
-        df_daily['value'] = df_daily['value'].interpolate(method='linear')
+        df_daily = to_daily(df, column)
         
         print(f"Daily data shape: {df_daily.shape}")
-
-        # Calculate differences using .diff()
-        df_daily['diff'] = df_daily['value'].diff()
-
-        # Get history
-        # history_diff = df_daily['diff'].dropna().tolist()
-        history_diff = df_daily['diff'].dropna().tolist()
-        last_value = df_daily['value'].iloc[-1]
-        current_date = df_daily.index[-1]
-
-        print(f"Last value: {last_value:.2f}")
-        print(f"History diffs available: {len(history_diff)}")
-        print(f"Current date: {current_date}")
+        print(f"Last value: {df_daily['value'].iloc[-1]:.2f}")
+        print(f"Current date: {df_daily.index[-1]}")
 
         future_value_predictions = []
-        future_aqi_predictions = []
         future_dates = []
 
-        # Features (feature order must match training)
-        feature_order = [
-            'lag_1', 'lag_2', 'lag_3', 'lag_4', 'lag_5', 'lag_6', 'lag_7',
-            'lag_14', 'lag_30',
-            'rolling_mean_7', 'rolling_std_7',
-            'day_of_week_sin', 'day_of_week_cos', 'day_of_year_sin', 'day_of_year_cos'
-        ]
-
         # Predict next 7 days
-        for i in range(1, 8):
-            next_date = current_date + timedelta(days=i)
-
-            # Create features
-            features = create_features(history_diff, next_date)
-            # print(f'create {i} feature check') # debugging
-            X_next = pd.DataFrame([features], columns=feature_order)
-
-            # Scale features
-            X_next_scaled = scaler.transform(X_next)
-
-            # Predict difference
-            pred_diff = float(model.predict(X_next_scaled)[0])
-
-            pred_value = max(0, last_value + pred_diff)
-
+        for i, (next_date, pred_value, pred_diff) in enumerate(forecast_from_daily(df_daily, model, scaler), 1):
             future_value_predictions.append(round(pred_value))
-
             future_dates.append(next_date.strftime('%Y-%m-%d'))
 
             print(f"Day {i}: {next_date.strftime('%Y-%m-%d')} -> {pred_value:2f} μg/m³ (Δ: {pred_diff:2f})") 
 
-            # Append for next iteration
-            history_diff.append(pred_diff)
-            last_value = pred_value
-
         # Convert pm25 values to aqi
-        for value in future_value_predictions:
-            aqi_val = aqi.to_iaqi(aqi.POLLUTANT_PM25, value, algo=aqi.ALGO_EPA) 
-            future_aqi_predictions.append(int(aqi_val))
+        future_aqi_predictions = [int(aqi_val) for aqi_val in iaqi('pm25', future_value_predictions)]
 
         print(f"Predictions generated!")
         return future_dates, future_aqi_predictions, future_value_predictions
@@ -0,0 +1,155 @@
+# Opt-in per-request profiling for the Flask app.
+#
+# A request is profiled with cProfile when either
+#   - it is sampled: PROFILE_SAMPLE_RATE (0..1, default 0) of all requests, or
+#   - it carries ?profile=<expiry>.<signature>: the HMAC of path and expiry under PROFILE_SECRET (see sign();
+#     disabled without a secret). Links stop working at the expiry, so one leaked into a log cannot be replayed
+# Each profiled request writes profiles/<time>_<pid>_<endpoint>_<ms>.prof (open with snakeviz or pstats) and prints
+# its top PROFILE_TOP_N functions by cumulative time, which is enough to tell OpenAQ calls, read_json, AQI,
+# XGBoost and plotly rendering apart.
+#
+# The sample rate can be changed on a running server by writing a number to profiles/sample_rate;
+# that file overrides the env var and is re-read when it changes. Delete it to go back to the env var.
+#
+# Only one request is profiled at a time (cProfile cannot run twice at once); requests arriving meanwhile
+# are served unprofiled. For streamed responses (/stream) only the view function is covered, not the stream.
+
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+# Settings are read per use rather than at import: app.py imports this module before load_dotenv() runs
+def profile_dir():
+    return os.getenv('PROFILE_DIR', 'profiles')
+
+def rate_file():
+    return os.path.join(profile_dir(), 'sample_rate')
+
+_active = threading.Lock()
+_rate = {'mtime': None, 'value': None}
+
+SIGNATURE_TTL = 15 * 60 # default lifetime of a ?profile= value, seconds
+
+def signature(path, expires, secret):
+    return hmac.new(secret.encode(), f'{path}|{expires}'.encode(), hashlib.sha256).hexdigest()
+
+def sign(path, ttl=SIGNATURE_TTL, secret=None):
+    # Value for ?profile= on the given path, valid for ttl seconds, e.g. sign('/dashboard')
+    secret = secret or os.getenv('PROFILE_SECRET', '')
+    expires = int(time.time()) + int(ttl)
+    return f'{expires}.{signature(path, expires, secret)}'
+
+def verify(value, path, secret):
+    expires, _, digest = value.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(digest, signature(path, int(expires), secret))
+
+def sample_rate():
+    # profiles/sample_rate if present (re-read only when its mtime changes), else PROFILE_SAMPLE_RATE
+    path = rate_file()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _rate['mtime'] = None
+        return float(os.getenv('PROFILE_SAMPLE_RATE', '0') or 0)
+
+    if mtime != _rate['mtime']:
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = min(max(float(f.read().strip()), 0.0), 1.0)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring {path}: {e}")
+            value = 0.0
+        _rate['mtime'], _rate['value'] = mtime, value
+        print(f"Profiling sample rate set to {value} from {path}")
+    return _rate['value']
+
+def wants_profile(request):
+    value = request.args.get('profile')
+    if value is not None:
+        secret = os.getenv('PROFILE_SECRET')
+        if secret and verify(value, request.path, secret):
+            return True
+        print(f"Ignoring invalid or expired profile signature for {request.path}")
+
+    rate = sample_rate()
+    return rate > 0 and random.random() < rate
+
+def write_report(profiler, request, elapsed):
+    import io
+    import pstats
+
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+    name = f"{stamp}_{os.getpid()}_{endpoint}_{elapsed * 1000:.0f}ms.prof" # pid: workers share the directory
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(int(os.getenv('PROFILE_TOP_N', '20')))
+    print(f"Profile of {request.method} {request.path} ({elapsed:.3f}s) saved to {path}") # no query string: keeps the signature out of the log
+    print(summary.getvalue())
+    return path
+
+def init_profiling(app):
+    # Registers the before/after hooks; costs one random() and one stat() per request while disabled
+    from flask import g, request
+
+    @app.before_request
+    def start_profile():
+        if not wants_profile(request):
+            return
+        if not _active.acquire(blocking=False): # another request is being profiled
+            return
+
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e: # another profiler (a debugger, coverage) already owns the hook
+            _active.release()
+            print(f"Profiling unavailable: {e}")
+            return
+        g.profiler = profiler
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def stop_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        profiler.disable()
+        elapsed = time.perf_counter() - g.pop('profile_start')
+        try:
+            path = write_report(profiler, request, elapsed)
+            response.headers['X-Profile'] = os.path.basename(path)
+        except Exception as e:
+            print(f"Error writing profile: {e}")
+        finally:
+            _active.release()
+        return response
+
+    @app.teardown_request
+    def release_profile(exc):
+        # The view raised before after_request ran: drop the profile, free the slot
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _active.release()
+
+if __name__ == "__main__":
+    # python -m module.profiling /dashboard [ttl seconds]  ->  query parameter to profile that path
+    if len(sys.argv) not in (2, 3) or not os.getenv('PROFILE_SECRET'):
+        sys.exit("Usage: PROFILE_SECRET=... python -m module.profiling <path> [ttl seconds]")
+    ttl = int(sys.argv[2]) if len(sys.argv) == 3 else SIGNATURE_TTL
+    print(f"profile={sign(sys.argv[1], ttl)}")
@@ -0,0 +1,129 @@
+# Canonical in-memory layout of the frames passed between openaq_api, prediction and visualizer.
+#
+# Hourly series (daily / historic data):
+#   index   time_to  tz-aware DatetimeIndex (UTC), sorted
+#   value   float32  PM2.5 in µg/m³
+#   aqi     int16    US EPA AQI
+#   country category
+#   median, p10, p90, robust_mean  float32, station_count int16  (see module/aggregation.py; absent in older caches)
+#
+# Station ranking:
+#   time_to datetime64[ns, UTC]
+#   name    category
+#   value   float32
+#   aqi     int16
+#   location_id Int32, latitude/longitude float64  (absent in older caches)
+#
+# Stations (coordinates for the spatial index):
+#   location_id int32, name category, country_id int16, latitude/longitude float64
+#
+# Multi-pollutant hourly series:
+#   index   time_to  tz-aware DatetimeIndex (UTC), sorted
+#   pm25, pm10, o3, no2          float32 concentrations in EPA units (µg/m³, µg/m³, ppm, ppb)
+#   iaqi_pm25, iaqi_pm10, ...    Int16 (nullable: not every pollutant reports every hour)
+#   aqi     int16    composite US AQI (max IAQI)
+#   dominant, country  category
+#
+# The getters in openaq_api apply these on both the cache and the fetch path, so callers always see the same dtypes.
+
+from module.iaqi import BREAKPOINTS, iaqi
+
+STATISTIC_DTYPES = {'median': 'float32', 'p10': 'float32', 'p90': 'float32', 'robust_mean': 'float32', 'station_count': 'int16'}
+
+def to_utc(times):
+    import pandas as pd
+
+    # Fresh data carries local offsets (+07:00), cached data is ISO 'Z'; both end up in UTC.
+    # Naive strings (older ranking caches) are taken as UTC.
+    return pd.to_datetime(times, utc=True, format='ISO8601')
+
+def to_aqi_int(values):
+    import pandas as pd
+
+    # aqi.to_aqi returned Decimal in older caches, the JSON cache returns float
+    return pd.to_numeric(values).round().astype('int16')
+
+def compact_series_frame(df, country=None):
+    import pandas as pd
+
+    if 'time_to' in df.columns:
+        index = pd.DatetimeIndex(to_utc(df['time_to']), name='time_to')
+    else:
+        index = pd.DatetimeIndex(to_utc(df.index), name='time_to')
+
+    # Rows without a reading are dropped here rather than carried as NaN
+    values = pd.to_numeric(df['value'])
+    keep = values.notna().to_numpy()
+
+    compact = pd.DataFrame({
+        'value': values.to_numpy(dtype='float32')[keep]
+    }, index=index[keep])
+    if 'aqi' in df.columns:
+        compact['aqi'] = to_aqi_int(df['aqi'][keep]).to_numpy()
+    else: # older caches (e.g. cache_57_365d.json) were saved without the aqi column
+        compact['aqi'] = iaqi('pm25', values[keep]).astype('int16')
+
+    for column, dtype in STATISTIC_DTYPES.items():
+        if column in df.columns:
+            compact[column] = pd.to_numeric(df[column]).to_numpy()[keep].astype(dtype)
+
+    if country is not None:
+        compact['country'] = pd.Categorical([country] * len(compact))
+
+    return compact.sort_index()
+
+def compact_pollutant_frame(df, country=None):
+    import pandas as pd
+
+    index = pd.DatetimeIndex(to_utc(df['time_to']), name='time_to')
+    compact = pd.DataFrame(index=index)
+
+    for pollutant in BREAKPOINTS:
+        if pollutant in df.columns:
+            compact[pollutant] = pd.to_numeric(df[pollutant]).to_numpy(dtype='float32')
+    for pollutant in BREAKPOINTS:
+        if f'iaqi_{pollutant}' in df.columns:
+            compact[f'iaqi_{pollutant}'] = pd.to_numeric(df[f'iaqi_{pollutant}']).round().to_numpy()
+            compact[f'iaqi_{pollutant}'] = compact[f'iaqi_{pollutant}'].astype('Int16')
+
+    compact['aqi'] = to_aqi_int(df['aqi']).to_numpy()
+    compact['dominant'] = pd.Categorical(df['dominant'].to_numpy())
+    if country is not None:
+        compact['country'] = pd.Categorical([country] * len(compact))
+
+    return compact.sort_index()
+
+def compact_ranking_frame(df):
+    import pandas as pd
+
+    compact = pd.DataFrame({
+        'time_to': to_utc(df['time_to']),
+        'name': df['name'].astype('category'),
+        'value': pd.to_numeric(df['value']).astype('float32'),
+        'aqi': to_aqi_int(df['aqi'])
+    })
+    if 'location_id' in df.columns:
+        compact['location_id'] = pd.to_numeric(df['location_id']).astype('Int32')
+        compact['latitude'] = pd.to_numeric(df['latitude']).astype('float64')
+        compact['longitude'] = pd.to_numeric(df['longitude']).astype('float64')
+    return compact.reset_index(drop=True)
+
+def compact_station_frame(df):
+    import pandas as pd
+
+    # float64 coordinates: float32 would cost up to ~1 m at these magnitudes, and this frame is small
+    return pd.DataFrame({
+        'location_id': pd.to_numeric(df['location_id']).astype('int32'),
+        'name': df['name'].astype('category'),
+        'country_id': pd.to_numeric(df['country_id']).astype('int16'),
+        'latitude': pd.to_numeric(df['latitude']).astype('float64'),
+        'longitude': pd.to_numeric(df['longitude']).astype('float64')
+    }).reset_index(drop=True)
+
+def memory_report(df, label=''):
+    # Deep memory usage per column (index included), printed as one line per frame
+    usage = df.memory_usage(deep=True, index=True)
+    report = {column: int(size) for column, size in usage.items()}
+    total = int(usage.sum())
+    print(f"Frame {label}: {len(df)} rows, {total / 1024:.1f} KB ({', '.join(f'{column}={size / 1024:.1f}' for column, size in report.items())})")
+    return {'rows': len(df), 'total_bytes': total, 'columns': report}
@@ -0,0 +1,162 @@
+# Spatial index over the cached station locations.
+#
+# Stations come from every data/cache_<country>_stations.json (coordinates) and the latest readings from
+# every data/cache_<country>_ranking.json, so a "my location" lookup is an in-memory query instead of a
+# country-wide crawl. Coordinates are stored as 3D points on the unit sphere in a KD-tree: the straight-line
+# (chord) distance between two such points grows with the great-circle distance, so nearest/radius queries
+# on the tree are exact on the globe, including across the antimeridian.
+# The index is rebuilt when a station or ranking cache file is added or rewritten.
+
+import math
+import os
+import re
+import threading
+from module.cache import CACHE_DIR, read_cache
+
+EARTH_RADIUS_KM = 6371.0088
+IDW_POWER = 2 # weight = 1 / distance^2
+IDW_MAX_KM = 50 # readings further away than this are not used for a local estimate
+SAME_PLACE_KM = 0.01 # closer than 10 m: use that station's reading as is
+READING_MAX_AGE = int(os.getenv('NEARBY_READING_MAX_AGE', str(3 * 3600))) # seconds; older readings are left out of the estimate
+
+CACHE_FILE_PATTERN = re.compile(r'^cache_(\d+)_(stations|ranking)\.json$')
+
+_index = None
+_index_lock = threading.Lock()
+
+def to_unit_vectors(latitudes, longitudes):
+    import numpy as np
+
+    lat = np.radians(np.asarray(latitudes, dtype='float64'))
+    lon = np.radians(np.asarray(longitudes, dtype='float64'))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def chord_to_km(chord):
+    import numpy as np
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+class StationIndex:
+    def __init__(self, stations):
+        from scipy.spatial import cKDTree
+
+        # stations: location_id, name, country_id, latitude, longitude, plus value/aqi/time_to where a reading is cached
+        self.stations = stations.reset_index(drop=True)
+        self.tree = cKDTree(to_unit_vectors(self.stations['latitude'], self.stations['longitude'])) if len(self.stations) else None
+
+    def __len__(self):
+        return len(self.stations)
+
+    def result(self, positions, chords):
+        found = self.stations.iloc[positions].copy()
+        found['distance_km'] = chord_to_km(chords)
+        return found.sort_values('distance_km').reset_index(drop=True)
+
+    def nearest(self, lat, lon, k=5):
+        import numpy as np
+
+        if self.tree is None:
+            return self.stations.assign(distance_km=[])
+        k = min(k, len(self.stations))
+        chords, positions = self.tree.query(to_unit_vectors([lat], [lon])[0], k=k)
+        return self.result(np.atleast_1d(positions), np.atleast_1d(chords))
+
+    def within(self, lat, lon, km):
+        import numpy as np
+
+        if self.tree is None:
+            return self.stations.assign(distance_km=[])
+        point = to_unit_vectors([lat], [lon])[0]
+        positions = np.asarray(self.tree.query_ball_point(point, km_to_chord(km)), dtype=np.int64)
+        chords = np.linalg.norm(self.tree.data[positions] - point, axis=1) if len(positions) else np.zeros(0)
+        return self.result(positions, chords)
+
+    def local_aqi(self, lat, lon, max_km=IDW_MAX_KM, power=IDW_POWER, max_age=READING_MAX_AGE):
+        # Inverse-distance-weighted PM2.5 from the stations with a reading newer than max_age seconds, converted
+        # to AQI. Readings come from the ranking caches (the latest 10 stations per country), so most indexed
+        # stations have none; None when no recent reading is within max_km
+        import numpy as np
+        import pandas as pd
+        from module.iaqi import iaqi
+
+        nearby = self.within(lat, lon, max_km)
+        if 'value' not in nearby.columns:
+            return None
+        now = pd.Timestamp.now(tz='UTC')
+        nearby = nearby[nearby['value'].notna() & (nearby['time_to'] >= now - pd.Timedelta(seconds=max_age))]
+        if nearby.empty:
+            return None
+
+        distances = nearby['distance_km'].to_numpy()
+        values = nearby['value'].to_numpy(dtype='float64')
+        if distances[0] < SAME_PLACE_KM:
+            pm25 = values[0]
+        else:
+            weights = 1 / distances ** power
+            pm25 = float(np.sum(weights * values) / np.sum(weights))
+
+        return {
+            'pm25': round(float(pm25), 2),
+            'aqi': int(iaqi('pm25', [pm25])[0]),
+            'stations_used': len(nearby),
+            'nearest_km': round(float(distances[0]), 2),
+            'newest_reading_age_s': int((now - nearby['time_to'].max()).total_seconds())
+        }
+
+def cached_files():
+    # {(country_id, kind): mtime} for every station/ranking cache file
+    files = {}
+    if not os.path.isdir(CACHE_DIR):
+        return files
+    for entry in os.scandir(CACHE_DIR):
+        match = CACHE_FILE_PATTERN.match(entry.name)
+        if match:
+            files[(int(match.group(1)), match.group(2))] = entry.stat().st_mtime
+    return files
+
+def build_index(files):
+    import pandas as pd
+    from module.schema import compact_ranking_frame, compact_station_frame
+
+    stations = []
+    readings = []
+    for country_id, kind in files:
+        df = read_cache(f'{country_id}_{kind}')
+        if df is None or df.empty:
+            continue
+        if kind == 'stations':
+            stations.append(compact_station_frame(df))
+        elif 'location_id' in df.columns: # older ranking caches have no location ids to join on
+            readings.append(compact_ranking_frame(df)[['location_id', 'value', 'aqi', 'time_to']])
+
+    if not stations:
+        return StationIndex(pd.DataFrame(columns=['location_id', 'name', 'country_id', 'latitude', 'longitude']))
+
+    stations = pd.concat(stations, ignore_index=True).drop_duplicates('location_id')
+    if readings:
+        latest = pd.concat(readings, ignore_index=True).sort_values('time_to').drop_duplicates('location_id', keep='last')
+        latest['location_id'] = latest['location_id'].astype('int32')
+        stations = stations.merge(latest, on='location_id', how='left')
+
+    print(f"Spatial index built: {len(stations)} stations from {len(files)} cache files")
+    return StationIndex(stations)
+
+def get_station_index():
+    global _index
+    files = cached_files()
+    with _index_lock:
+        if _index is None or _index[0] != files:
+            _index = (files, build_index(files))
+        return _index[1]
+
+def nearest_stations(lat, lon, k=5):
+    return get_station_index().nearest(lat, lon, k)
+
+def stations_within(lat, lon, km):
+    return get_station_index().within(lat, lon, km)
+
+def local_aqi(lat, lon, max_km=IDW_MAX_KM):
+    return get_station_index().local_aqi(lat, lon, max_km)
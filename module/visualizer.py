@@ -1,8 +1,7 @@
-import plotly.graph_objects as go
-import plotly.io as pio
 from datetime import datetime
-from module.openaq_api import *
-from module.prediction import *
+
+# plotly is imported inside the chart builders; the colour/status helpers below are
+# also used by templates and the console app and must not pull it in
 
 def get_aqi_color(aqi):
     if aqi <= 50:
@@ -36,22 +35,31 @@ def current_values(df):
     pass
 
 def create_hourly_line_chart(hourly_df, metric='pm25'):
-    df_plot = hourly_df.copy()
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    df_plot = hourly_df
 
-    # Format labels (check this afterwards)
+    # Format labels
     labels = []
-    for t in df_plot['time_to']:
-        # Convert to string and slice the first 19 characters
-        t_str = str(t)[:19]
+    if 'time_to' in df_plot.columns:
+        for t in df_plot['time_to']:
+            # Convert to string and slice the first 19 characters
+            t_str = str(t)[:19]
 
-        # Parse the datetime
-        dt = datetime.strptime(t_str, '%Y-%m-%dT%H:%M:%S')
-        # or: dt = datetime.strptime(t, "%Y-%m-%dT%H:%M:%S.%fZ")
+            # Parse the datetime
+            dt = datetime.strptime(t_str, '%Y-%m-%dT%H:%M:%S')
+            # or: dt = datetime.strptime(t, "%Y-%m-%dT%H:%M:%S.%fZ")
 
-        # Format it
-        formatted = dt.strftime('%H:%M<br>%b %d')
+            # Format it
+            formatted = dt.strftime('%H:%M<br>%b %d')
 
-        labels.append(formatted)
+            labels.append(formatted)
+    else:
+        labels = df_plot.index.strftime('%H:%M<br>%b %d').tolist() # compact frames are indexed by time_to
+
+    error_y = None
+    customdata = None
 
     if metric == 'pm25':
         values = df_plot['value'].tolist()
@@ -59,6 +67,20 @@ def create_hourly_line_chart(hourly_df, metric='pm25'):
         hover_template = '<b>%{x}</b><br>PM2.5: %{y:.2f} μg/m³>' # %{}: insert data; <extra>:remove default hover text
         colors = [get_aqi_color(aqi) for aqi in df_plot['aqi']]
 
+        # Station spread (p10-p90) as error bars, when the frame carries the hourly statistics
+        if 'p10' in df_plot.columns and 'p90' in df_plot.columns:
+            error_y = dict(
+                type='data',
+                symmetric=False,
+                array=(df_plot['p90'] - df_plot['value']).clip(lower=0).tolist(),
+                arrayminus=(df_plot['value'] - df_plot['p10']).clip(lower=0).tolist(),
+                color='#a0aec0',
+                thickness=1,
+                width=2
+            )
+            hover_template = '<b>%{x}</b><br>PM2.5: %{y:.2f} μg/m³<br>Stations p10-p90: %{customdata[0]:.1f} - %{customdata[1]:.1f}>'
+            customdata = df_plot[['p10', 'p90']].to_numpy()
+
     else:  # aqi
         values = df_plot['aqi'].tolist()
         y_title = 'AQI (US)'
@@ -75,6 +97,8 @@ def create_hourly_line_chart(hourly_df, metric='pm25'):
             color=colors,
             line=dict(width=0) # border of marker
         ),
+        error_y=error_y,
+        customdata=customdata,
         hovertemplate=hover_template,
         showlegend=False
     ))
@@ -108,6 +132,9 @@ def create_hourly_line_chart(hourly_df, metric='pm25'):
     return pio.to_html(fig, include_plotlyjs='cdn', div_id='hourly-line-chart', config={'displayModeBar': False}) # don't display mode bar
 
 def create_prediction_column_chart(prediction_dates, prediction_values, prediction_aqi, metric='pm25'):
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
     if not prediction_dates or not prediction_values:
         return '<div style="text-align: center; padding: 100px; color: #718096; font-size: 16px;">⚠️ Predictions unavailable</div>'
 